@@ -5,43 +5,99 @@ import re
 import json
 import os
 import html
-from typing import Final
-from concurrent.futures import ThreadPoolExecutor
+import collections
+import functools
+import shutil
+import threading
+from pathlib import Path
+from typing import Final, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib json
+    orjson = None
+
 BASE_URL = "https://sites.google.com/site/coletaneacantorcristao"
+_BASE_LEN = len(BASE_URL)
 MAX_THREADS: Final[int] = 3
 OUTPUT_DIR = "output/cantor_cristao_html"
 
+# Each fetch thread keeps its own Session (and keep-alive connection)
+_thread_local = threading.local()
+
+# Regex to match links starting with a number (e.g., 001-...)
+_MENU_LINK_RE = re.compile(r"/(\d{3})-")
+
+# Page <title>, e.g. "Coletânea Cantor Cristão - 1 - Antífona"
+_TITLE_RE = re.compile(r"<title[^>]*>([^<]+)</title>", re.IGNORECASE)
+_TITLE_PARTS_RE = re.compile(r"Coletânea Cantor Cristão - (\d+) - (.+)")
+
+# Escaped <p> fragments embedded in the page data, and any tag inside them
+_P_RE = re.compile(r"&lt;p&gt;(.*?)(?:&lt;/p&gt;|(?=&lt;p&gt;)|\Z)", re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]+>")
+# Stands in for a stripped tag; never occurs in page text
+_TAG_SENTINEL = "\x00"
+
+# Fragments containing any of these are metadata, not lyrics
+SKIP_KEYWORDS = (
+    "Slides:",
+    "Baixar Apresentação",
+    "Iniciar SlideShow",
+    "Amostra sonora",
+    "Kits de voz",
+    "Vídeos:",
+    "Obs.:",
+    "Cifragem",
+    "Partituras",
+    "Arquivos para edição",
+    "Tom original",
+    "Soprano:",
+    "Contralto:",
+    "Tenor:",
+    "Baixo:",
+    "MIDI(",
+    "MP3(",
+    "jsaction",
+)
+# Credit lines are only skipped when the fragment starts with them
+SKIP_PREFIXES = ("Letra:", "Música:")
+_SKIP_RE = re.compile(
+    "|".join(
+        ["^" + re.escape(p) for p in SKIP_PREFIXES]
+        + [re.escape(k) for k in SKIP_KEYWORDS]
+    )
+)
+
+
+def fetch_menu_links(session: Optional[requests.Session] = None):
+    session = session or get_thread_session()
 
-def fetch_menu_links():
     print(f"Fetching {BASE_URL}...")
-    response = requests.get(BASE_URL)
+    response = session.get(BASE_URL, timeout=30)
     response.raise_for_status()
 
-    soup = BeautifulSoup(response.content, "html.parser")
-
-    # Find all links
-    links = []
-    # Regex to match links starting with a number (e.g., 001-...)
-    pattern = re.compile(r"/(\d{3})-")
+    soup = BeautifulSoup(response.content, "lxml")
 
+    # Find all links, keeping the hymn number of each for sorting
+    numbers = {}
     for a_tag in soup.find_all("a", href=True):
         href = a_tag["href"]
-        full_url = urljoin(BASE_URL, href)
+        # Absolute links to the site need no resolving
+        full_url = href if href.startswith(BASE_URL) else urljoin(BASE_URL, href)
 
         if full_url.startswith(BASE_URL):
-            # Check if the path part matches the pattern
-            path = full_url.replace(BASE_URL, "")
-            match = pattern.search(path)
+            # Check if the path part (everything after BASE_URL) matches
+            match = _MENU_LINK_RE.search(full_url, _BASE_LEN)
             if match:
                 number = int(match.group(1))
                 if number > 0:  # Exclude 000
-                    links.append(full_url)
+                    numbers.setdefault(full_url, number)
 
-    # Remove duplicates and sort
-    links = sorted(list(set(links)))
+    # Dict keys are already unique; sort by hymn number, then URL
+    links = sorted(numbers, key=lambda url: (numbers[url], url))
 
     print(f"Found {len(links)} hymn links.")
 
@@ -62,18 +118,36 @@ def fetch_menu_links():
 
 def get_session():
     session = requests.Session()
-    retries = Retry(
+    retry_options = dict(
         total=5,
         backoff_factor=1,
-        status_forcelist=[500, 502, 503, 504],
+        status_forcelist=[429, 500, 502, 503, 504],
         allowed_methods=["GET"],
+        respect_retry_after_header=True,
     )
-    session.mount("https://", HTTPAdapter(max_retries=retries))
-    session.mount("http://", HTTPAdapter(max_retries=retries))
+    try:
+        # Jitter keeps the worker threads from retrying in lockstep
+        retries = Retry(**retry_options, backoff_jitter=1.0)
+    except TypeError:
+        # urllib3 < 2.0 has no backoff_jitter
+        retries = Retry(**retry_options)
+    adapter = HTTPAdapter(
+        pool_connections=MAX_THREADS, pool_maxsize=MAX_THREADS, max_retries=retries
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_thread_session() -> requests.Session:
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = get_session()
+        _thread_local.session = session
     return session
 
 
-def fetch_page(url: str, session: requests.Session):
+def fetch_page(url: str):
     filename = url.split("/")[-1]
     filepath = os.path.join(OUTPUT_DIR, f"{filename}.html")
 
@@ -83,7 +157,7 @@ def fetch_page(url: str, session: requests.Session):
 
     try:
         print(f"Fetching {url}...")
-        response = session.get(url, timeout=30)
+        response = get_thread_session().get(url, timeout=30)
         response.raise_for_status()
 
         with open(filepath, "w", encoding="utf-8") as f:
@@ -102,133 +176,125 @@ def fetch_all_pages():
 
     print(f"Preparing to fetch {len(links)} pages...")
 
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
-
-    session = get_session()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-        futures = [executor.submit(fetch_page, link, session) for link in links]
-        for future in futures:
+        futures = [executor.submit(fetch_page, link) for link in links]
+        for future in as_completed(futures):
             future.result()
 
     print("Done fetching pages.")
 
 
+# Navigation and footer fragments repeat on every page, so most lookups hit
+@functools.lru_cache(maxsize=4096)
+def _unescape(s: str) -> str:
+    return html.unescape(s)
+
+
 def extract_hymn_data(filepath: str):
     with open(filepath, "r", encoding="utf-8") as f:
         content = f.read()
 
     # Extract Title and Number from <title> tag
-    soup_title = BeautifulSoup(content, "html.parser")
-    title_tag = soup_title.find("title")
+    title_match = _TITLE_RE.search(content)
     number = 0
     title = "Unknown"
 
-    if title_tag:
-        title_text = title_tag.get_text().strip()
-        match = re.search(r"Coletânea Cantor Cristão - (\d+) - (.+)", title_text)
+    if title_match:
+        title_text = html.unescape(title_match.group(1)).strip()
+        match = _TITLE_PARTS_RE.search(title_text)
         if match:
             number = int(match.group(1))
             title = match.group(2).strip()
 
     # Extract Lyrics from escaped content
-    # Split by &lt;p&gt;
-    parts = content.split("&lt;p&gt;")
-
+    # Each fragment runs from &lt;p&gt; up to its closing tag or the next &lt;p&gt;
     lyrics_blocks = []
     verse_counter = 1
 
-    for i, part in enumerate(parts):
-        if i == 0:
-            continue
+    for p_match in _P_RE.finditer(content):
+        unescaped_content = _unescape(p_match.group(1))
 
-        # Truncate at closing tag if present
-        end_p_index = part.find("&lt;/p&gt;")
-        if end_p_index != -1:
-            part_content = part[:end_p_index]
-        else:
-            part_content = part
-
-        unescaped_content = html.unescape(part_content)
-
-        # Parse fragment
-        fragment_soup = BeautifulSoup(unescaped_content, "html.parser")
-        text = fragment_soup.get_text().strip()
+        # Strip tags once, leaving a sentinel where each tag was: dropping it
+        # gives get_text(), turning it into a newline gives
+        # get_text(separator="\n")
+        raw = _unescape(_TAG_RE.sub(_TAG_SENTINEL, unescaped_content))
+        text = raw.replace(_TAG_SENTINEL, "").strip()
 
         # Filter
         if not text:
             continue
 
         # Filter out metadata
-        skip_keywords = [
-            "Slides:",
-            "Baixar Apresentação",
-            "Iniciar SlideShow",
-            "Amostra sonora",
-            "Kits de voz",
-            "Vídeos:",
-            "Obs.:",
-            "Cifragem",
-            "Partituras",
-            "Arquivos para edição",
-            "Tom original",
-            "Soprano:",
-            "Contralto:",
-            "Tenor:",
-            "Baixo:",
-            "MIDI(",
-            "MP3(",
-            "jsaction",
-        ]
-        if any(x in text for x in skip_keywords):
-            continue
-
-        if text.startswith("Letra:") or text.startswith("Música:"):
+        if _SKIP_RE.search(text):
             continue
 
         # Extract lines
         lines = [
-            l.strip()
-            for l in fragment_soup.get_text(separator="\n").split("\n")
-            if l.strip()
+            stripped
+            for l in raw.replace(_TAG_SENTINEL, "\n").split("\n")
+            if (stripped := l.strip())
         ]
-
-        if lines:
-            verse_text = "\n".join(lines)
-            lyrics_blocks.append(f"[Verse {verse_counter}]\n{verse_text}")
-            verse_counter += 1
+        verse_text = "\n".join(lines)
+        lyrics_blocks.append(f"[Verse {verse_counter}]\n{verse_text}")
+        verse_counter += 1
 
     full_lyrics = "\n\n".join(lyrics_blocks)
 
     return {"no": number, "title": title, "lyrics": full_lyrics}
 
 
+def dumps_json(data: dict) -> bytes:
+    """Indented UTF-8 JSON, via orjson when installed, else the stdlib json."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def process_one(filename: str):
+    """Parse a single downloaded page. Runs inside a worker process."""
+    filepath = os.path.join(OUTPUT_DIR, filename)
+    try:
+        return filename, extract_hymn_data(filepath)
+    except Exception as e:
+        print(f"Error processing {filename}: {e}")
+        return filename, None
+
+
 def process_local_files():
     json_dir = "output/cc_json"
     md_dir = "output/cc_markdown"
 
     # Clear existing directories to avoid stale files
     if os.path.exists(json_dir):
-        import shutil
-
         shutil.rmtree(json_dir)
     if os.path.exists(md_dir):
-        import shutil
-
         shutil.rmtree(md_dir)
 
     os.makedirs(json_dir, exist_ok=True)
     os.makedirs(md_dir, exist_ok=True)
 
-    html_files = sorted([f for f in os.listdir(OUTPUT_DIR) if f.endswith(".html")])
+    html_files = sorted(
+        e.name
+        for e in os.scandir(OUTPUT_DIR)
+        if e.is_file() and e.name.endswith(".html")
+    )
     print(f"Processing {len(html_files)} HTML files...")
 
-    for filename in html_files:
-        filepath = os.path.join(OUTPUT_DIR, filename)
-        try:
-            data = extract_hymn_data(filepath)
+    # Parsing runs in worker processes; naming and writes stay here so the
+    # collision counter is deterministic
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(executor.map(process_one, html_files, chunksize=16))
 
+    # The JSON dir was just recreated, so collisions can only come from
+    # duplicate numbers within this run
+    used_names = collections.Counter()
+    for filename, data in results:
+        if data is None:
+            continue
+
+        try:
             if data["no"] == 0:
                 # Try to extract number from filename if title extraction failed
                 # filename format: 001-antífona.html
@@ -240,27 +306,26 @@ def process_local_files():
 
             # Determine filename with collision handling
             base_name = str(data["no"])
-            json_filename = f"{base_name}.json"
-            json_path = os.path.join(json_dir, json_filename)
-
-            counter = 2
-            while os.path.exists(json_path):
+            used_names[base_name] += 1
+            counter = used_names[base_name]
+            if counter == 1:
+                json_filename = f"{base_name}.json"
+            else:
                 json_filename = f"{base_name}-{counter}.json"
-                json_path = os.path.join(json_dir, json_filename)
-                counter += 1
+
+            json_path = os.path.join(json_dir, json_filename)
 
             # Corresponding markdown filename
             md_filename = json_filename.replace(".json", ".md")
             md_path = os.path.join(md_dir, md_filename)
 
             # Save JSON
-            with open(json_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            json_content = dumps_json(data)
+            Path(json_path).write_bytes(json_content)
 
             # Save Markdown
             md_content = f"# {data['no']}. {data['title']}\n\n{data['lyrics']}"
-            with open(md_path, "w", encoding="utf-8") as f:
-                f.write(md_content)
+            Path(md_path).write_text(md_content, encoding="utf-8")
 
         except Exception as e:
             print(f"Error processing {filename}: {e}")
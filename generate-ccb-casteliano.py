@@ -1,86 +1,131 @@
-import re
 import json
+import mmap
+import re
 import os
-from typing import Dict, List, Optional
+from itertools import chain, starmap
+from typing import Dict, Final, List, Optional, Tuple
 from rich.console import Console
 from rich.progress import track
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib json
+    orjson = None
+
 OUTPUT_DIR = "./output"
 OUTPUT_JSON_DIR = "./output/ccb_casteliano_json"
 OUTPUT_MD_DIR = "./output/ccb_casteliano_markdown"
+JSON_PREFIX = f"{OUTPUT_JSON_DIR}/"
+MD_PREFIX = f"{OUTPUT_MD_DIR}/"
 INPUT_FILE = "./Hinario CCB 5 Casteliano.txt"
+# Indented JSON for human reading; False emits compact JSON (smaller and
+# faster to write)
+PRETTY_JSON: Final[bool] = True
+# When True, export every hymn to one JSONL and one Markdown file (two
+# sequential writes) instead of a pair of files per hymn
+SINGLE_FILE_OUTPUT: Final[bool] = False
+OUTPUT_JSONL_FILE = "./output/ccb_casteliano.jsonl"
+OUTPUT_MD_FILE = "./output/ccb_casteliano.md"
+# Fixed parts of the Markdown front matter
+MD_FRONT_OPEN = "---\nno: "
+MD_FRONT_MID = "\ntitle: "
+MD_FRONT_CLOSE = "\n---\n\n"
+
+# Hymn header: "Number Title" at the start of a line, possibly after a form
+# feed (the file itself opens with several). A hymn's body runs up to the
+# next header. Bytes pattern, applied directly to the memory-mapped file
+HYMN_HEADER_RE = re.compile(rb"(?:\A\f*|^\f?)(\d+)[^\S\n]+([^\n]+)\n?", re.MULTILINE)
+# Start of the index at the end of the book; nothing after it is a hymn
+INDEX_MARKER = "Índice".encode("utf-8")
+
+# Patterns used by parse_hymn_block
+TITLE_PARENS_RE = re.compile(r"\s*\(.*?\)\s*")
+WHITESPACE_RE = re.compile(r"\s+")
 
 console = Console()
 
 
-def parse_hymn_block(block: str) -> Optional[Dict]:
-    """Processa um bloco de texto cru contendo um único hino."""
-    raw_lines = block.splitlines()
-
-    # Encontra a linha do cabeçalho
-    header_line_idx = -1
-    # Pattern for "Number Title" (e.g. "1 Cristo, M aestro...")
-    # Handles optional form feed at start of line
-    # We use ^ to ensure it's at the start of the line (in the context of the block)
-    # Note: block.splitlines() removes \n, so we check each line.
-
-    for i, line in enumerate(raw_lines):
-        # Check if line starts with Number + Space + Text
-        # We allow optional form feed \f at the start
-        match = re.match(r"^\f?(\d+)\s+(.+)", line)
+def split_verse(line: str) -> Optional[Tuple[int, str]]:
+    """Split the leading verse number off a line ("1. Texto").
 
-        if match:
-            # Extra check: ensure it's not a verse (verses usually have "1." or are indented)
-            # If the line was indented, re.match with ^ would fail unless we stripped.
-            # But we didn't strip 'line'. So indented verses won't match.
-            # This is good. Headers are expected to be at the start of the line.
-
-            header_line_idx = i
-            hino_id = int(match.group(1))
-            title = match.group(2).strip()
-            break
-
-    if header_line_idx == -1:
+    Hand-rolled scan equivalent to ``^(\\d+)\\s*\\.?(.*)``: most lines start
+    with a letter and are rejected on the first character.
+    """
+    if not line or not line[0].isdecimal():
         return None
 
-    # Verificar se o título continua na próxima linha
-    body_start_idx = header_line_idx + 1
-
-    if body_start_idx < len(raw_lines):
-        next_line = raw_lines[body_start_idx].strip()
+    size = len(line)
+    i = 1
+    while i < size and line[i].isdecimal():
+        i += 1
+    j = i
+    while j < size and line[j].isspace():
+        j += 1
+    if j < size and line[j] == ".":
+        j += 1
+    return int(line[:i]), line[j:].strip()
+
+
+def split_chorus(line: str) -> Optional[str]:
+    """Return the text after a "CORO"/"Coro" marker (optional ":"), or None if
+    the line is not a chorus. The source only uses those two spellings, so a
+    literal test replaces the IGNORECASE regex."""
+    if line[:4] not in ("CORO", "Coro"):
+        return None
 
-        # Verifica se há uma linha de continuação do título
-        # Critérios: linha não vazia, não começa com número, não é CORO
-        if (
-            next_line
-            and not re.match(r"^\d+\s*\.?", next_line)
-            and not re.match(r"^(?:CORO|Coro)", next_line, re.IGNORECASE)
-        ):
-            # Verifica se após essa linha há linha vazia (confirma que é título)
-            if (
-                body_start_idx + 1 < len(raw_lines)
-                and not raw_lines[body_start_idx + 1].strip()
-            ):
-                title += " " + next_line
-                body_start_idx += 1
+    rest = line[4:].lstrip()
+    if rest[:1] == ":":
+        rest = rest[1:]
+    return rest.strip()
+
+
+def parse_hymn_block(hino_id: int, title: str, body: bytes) -> Optional[Dict]:
+    """Parse the raw body of a single hymn, already split from its header."""
+    # Walk the lines through an iterator (no list slice or indexed
+    # lookahead); only the first two are peeked to decide whether the title
+    # continues
+    lines = iter(body.decode("utf-8").splitlines())
+    first_line = next(lines, "")
+    second_line = next(lines, None)
+    head = [first_line] if second_line is None else [first_line, second_line]
+
+    # Verificar se o título continua na primeira linha do corpo
+    next_line = first_line.strip()
+
+    # Verifica se há uma linha de continuação do título
+    # Critérios: linha não vazia, não começa com número, não é CORO,
+    # e a linha seguinte existe e está vazia (confirma que é só o título)
+    if (
+        next_line
+        and not next_line[0].isdecimal()
+        and next_line[:4].lower() != "coro"
+        and second_line is not None
+        and not second_line.strip()
+    ):
+        title += " " + next_line
+        del head[0]
 
     # 2. Processar Letra
-    raw_body_lines = raw_lines[body_start_idx:]
-
-    lyrics_parts = []
+    # Lyrics built as a flat list of pieces, joined once at the end
+    lyrics_tokens = []
     current_label = ""
     current_buffer = []
     next_verse_number = 1
     expecting_new_block = False
 
+    # Hot-loop methods bound to locals (skips the attribute lookup per line)
+    append = current_buffer.append
+
     def flush_buffer():
         if current_label and current_buffer:
-            text = "\n".join(current_buffer)
-            lyrics_parts.append(f"[{current_label}]\n{text}")
+            lyrics_tokens.extend(
+                ("[", current_label, "]\n", "\n".join(current_buffer), "\n\n")
+            )
         current_buffer.clear()
 
-    for line in raw_body_lines:
-        stripped = line.strip()
+    for line in chain(head, lines):
+        lstripped = line.lstrip()
+        stripped = lstripped.rstrip()
 
         if not stripped:
             if current_buffer:
@@ -88,32 +133,25 @@ def parse_hymn_block(block: str) -> Optional[Dict]:
             continue
 
         # Calculate indentation
-        indentation = len(line) - len(line.lstrip())
-
-        # Detecta Verso (ex: "1. Texto")
-        verse_match = re.match(r"^(\d+)\s*\.?(.*)", stripped)
-
-        # Detecta Coro
-        chorus_match = re.match(
-            r"^(?:CORO|Coro)(?:\s*:)?\s*(.*)", stripped, re.IGNORECASE
-        )
+        indentation = len(line) - len(lstripped)
 
-        if verse_match:
+        # Dispatch on the first character: digit → Verse (e.g. "1. Texto"),
+        # "C" → maybe Chorus; anything else is plain text
+        first_char = stripped[0]
+        if first_char.isdecimal():
             flush_buffer()
-            verse_num = int(verse_match.group(1))
+            verse_num, content = split_verse(stripped)
             next_verse_number = verse_num + 1
             current_label = f"Verse {verse_num}"
-            content = verse_match.group(2).strip()
             if content:
-                current_buffer.append(content)
+                append(content)
             expecting_new_block = False
 
-        elif chorus_match:
+        elif first_char == "C" and (content := split_chorus(stripped)) is not None:
             flush_buffer()
             current_label = "Chorus"
-            content = chorus_match.group(1).strip()
             if content:
-                current_buffer.append(content)
+                append(content)
             expecting_new_block = False
 
         elif indentation >= 5:
@@ -121,7 +159,7 @@ def parse_hymn_block(block: str) -> Optional[Dict]:
             if current_label != "Chorus":
                 flush_buffer()
                 current_label = "Chorus"
-            current_buffer.append(stripped)
+            append(stripped)
             expecting_new_block = False
 
         else:
@@ -129,7 +167,7 @@ def parse_hymn_block(block: str) -> Optional[Dict]:
                 flush_buffer()
                 current_label = f"Verse {next_verse_number}"
                 next_verse_number += 1
-                current_buffer.append(stripped)
+                append(stripped)
                 expecting_new_block = False
             elif current_label == "Chorus":
                 # We were in Chorus, but now indentation dropped.
@@ -138,87 +176,148 @@ def parse_hymn_block(block: str) -> Optional[Dict]:
                 flush_buffer()
                 current_label = f"Verse {next_verse_number}"
                 next_verse_number += 1
-                current_buffer.append(stripped)
+                append(stripped)
             elif current_label:
-                current_buffer.append(stripped)
+                append(stripped)
             else:
                 current_label = "Verse 1"
                 next_verse_number = 2
-                current_buffer.append(stripped)
+                append(stripped)
                 expecting_new_block = False
 
     flush_buffer()
 
-    if not lyrics_parts:
+    if not lyrics_tokens:
         return None
 
-    title = re.sub(r"\s*\(.*?\)\s*", "", title).strip()
+    title = TITLE_PARENS_RE.sub("", title).strip()
     title = title.rstrip(" –")
     # Clean up extra spaces in title
-    title = re.sub(r"\s+", " ", title)
-
-    return {"no": hino_id, "title": title, "lyrics": "\n\n".join(lyrics_parts)}
-
-
-def main():
-    if not os.path.exists(OUTPUT_JSON_DIR):
-        os.makedirs(OUTPUT_JSON_DIR)
-
-    if not os.path.exists(OUTPUT_MD_DIR):
-        os.makedirs(OUTPUT_MD_DIR)
+    title = WHITESPACE_RE.sub(" ", title)
+
+    return {
+        "no": hino_id,
+        "title": title,
+        "lyrics": "".join(lyrics_tokens).rstrip("\n"),
+    }
+
+
+def dumps_json(data: Dict, pretty: bool) -> bytes:
+    """Serialize to UTF-8 with orjson or, when it is not installed, with the
+    stdlib json using the same formatting."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def md_pieces(hymn_data: Dict) -> Tuple[str, ...]:
+    """Pieces of a hymn's Markdown (front matter + lyrics), in order."""
+    return (
+        MD_FRONT_OPEN,
+        str(hymn_data["no"]),
+        MD_FRONT_MID,
+        hymn_data["title"],
+        MD_FRONT_CLOSE,
+        hymn_data["lyrics"],
+        "\n",
+    )
 
-    if not os.path.exists(INPUT_FILE):
-        console.print(f"[bold red]Arquivo {INPUT_FILE} não encontrado.[/bold red]")
-        return
 
-    console.print(f"[bold blue]Lendo arquivo:[/bold blue] {INPUT_FILE}")
+def format_md(hymn_data: Dict) -> str:
+    """Build a hymn's Markdown, with front matter."""
+    return "".join(md_pieces(hymn_data))
 
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        content = f.read()
 
-    # Split by "Number Title" at start of line (possibly with form feed)
-    # Regex: Lookahead for (Optional Form Feed) + (Start of Line) + (Digits) + (Space)
-    # We use re.MULTILINE so ^ matches start of line.
-    raw_hymns = re.split(r"(?=^\f?\d+\s+)", content, flags=re.MULTILINE)
+def emit(hymn_data: Dict) -> None:
+    """Save a hymn's JSON (keeps \\n escaped) and Markdown (with real line
+    breaks)."""
+    no = hymn_data["no"]
+    with open(f"{JSON_PREFIX}{no}.json", "wb") as f:
+        f.write(dumps_json(hymn_data, PRETTY_JSON))
+    with open(f"{MD_PREFIX}{no}.md", "w", encoding="utf-8", buffering=1 << 15) as f:
+        f.writelines(md_pieces(hymn_data))
 
-    # Filtra strings vazias
-    raw_hymns = [h for h in raw_hymns if h.strip()]
 
-    stop_processing = False
-    count = 0
-    for raw_block in track(raw_hymns, description="Processando hinos..."):
-        if stop_processing:
-            break
+def write_single_files(hymns: List[Dict]) -> None:
+    """Export every hymn to a single JSONL and a single Markdown file."""
+    with open(OUTPUT_JSONL_FILE, "wb", buffering=1 << 20) as f:
+        for hymn_data in hymns:
+            f.write(dumps_json(hymn_data, pretty=False))
+            f.write(b"\n")
 
-        # Check for Index marker
-        if "Índice" in raw_block:
-            # Truncate block at Índice
-            raw_block = raw_block.split("Índice")[0]
-            stop_processing = True
+    with open(OUTPUT_MD_FILE, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write("\n".join(format_md(hymn_data) for hymn_data in hymns))
 
-        hymn_data = parse_hymn_block(raw_block)
 
-        if hymn_data:
-            count += 1
-            json_file_name = f"{hymn_data['no']}.json"
-            json_file_path = os.path.join(OUTPUT_JSON_DIR, json_file_name)
+def main():
+    if SINGLE_FILE_OUTPUT:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+    else:
+        os.makedirs(OUTPUT_JSON_DIR, exist_ok=True)
+        os.makedirs(OUTPUT_MD_DIR, exist_ok=True)
 
-            with open(json_file_path, "w", encoding="utf-8") as f:
-                json.dump(hymn_data, f, indent=2, ensure_ascii=False)
+    if not os.path.exists(INPUT_FILE):
+        console.print(f"[bold red]Arquivo {INPUT_FILE} não encontrado.[/bold red]")
+        return
 
-            md_file_name = f"{hymn_data['no']}.md"
-            md_file_path = os.path.join(OUTPUT_MD_DIR, md_file_name)
+    console.print(f"[bold blue]Lendo arquivo:[/bold blue] {INPUT_FILE}")
 
-            md_content = f"""---
-no: {hymn_data['no']}
-title: {hymn_data['title']}
----
+    # Find every header in one pass and slice each body up to the next one.
+    # Bodies stay as bytes until parse_hymn_block decodes them
+    # mmap rejects an empty file (ValueError); empty just means no hymns
+    raw_hymns = []
+    if os.path.getsize(INPUT_FILE):
+        with (
+            open(INPUT_FILE, "rb") as f,
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content,
+        ):
+            headers = list(HYMN_HEADER_RE.finditer(content))
+            body_ends = [m.start() for m in headers[1:]] + [len(content)]
+            raw_hymns = [
+                (
+                    int(m.group(1)),
+                    m.group(2).decode("utf-8").strip(),
+                    content[m.end() : end],
+                )
+                for m, end in zip(headers, body_ends)
+            ]
+
+    # Check for Index marker: truncate that block at Índice and drop the rest
+    for i, (hino_id, title, body) in enumerate(raw_hymns):
+        cut = body.find(INDEX_MARKER)
+        if cut != -1:
+            raw_hymns[i] = (hino_id, title, body[:cut])
+            del raw_hymns[i + 1 :]
+            break
 
-{hymn_data['lyrics']}
-"""
+    # Parse and write serially, in file order (on a repeated number the later
+    # hymn wins). Parsing the whole hymnal takes a few ms, less than forking
+    # workers and pickling the bodies would cost
+    hymns = []
+    count = 0
+    results = starmap(parse_hymn_block, raw_hymns)
+    # Progress bar only on an interactive terminal; when redirected Rich
+    # has nothing useful to draw and it only costs time
+    if console.is_terminal:
+        results = track(
+            results,
+            total=len(raw_hymns),
+            description="Processando hinos...",
+            console=console,
+        )
+    for hymn_data in results:
+        if not hymn_data:
+            continue
+        count += 1
+        if SINGLE_FILE_OUTPUT:
+            hymns.append(hymn_data)
+        else:
+            emit(hymn_data)
 
-            with open(md_file_path, "w", encoding="utf-8") as f:
-                f.write(md_content)
+    if SINGLE_FILE_OUTPUT:
+        write_single_files(hymns)
 
     console.print(
         f"[bold green]Sucesso! {count} hinos exportados para JSON e Markdown[/bold green]"
@@ -1,76 +1,128 @@
-import re
 import json
+import mmap
+import re
 import os
-from typing import Dict, List, Optional
+from itertools import chain, starmap
+from typing import Dict, Final, List, Optional, Tuple
 from rich.console import Console
 from rich.progress import track
 
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele usa o json da stdlib
+    orjson = None
+
 OUTPUT_DIR = "./output"
 OUTPUT_JSON_DIR = "./output/ccb_json"
 OUTPUT_MD_DIR = "./output/ccb_markdown"
+JSON_PREFIX = f"{OUTPUT_JSON_DIR}/"
+MD_PREFIX = f"{OUTPUT_MD_DIR}/"
 INPUT_FILE = "./Hinario CCB 5 Cantado.txt"
+# JSON indentado para leitura humana; False gera JSON compacto (menor e
+# mais rápido de escrever)
+PRETTY_JSON: Final[bool] = True
+# Quando True, exporta todos os hinos em um único JSONL e um único Markdown
+# (duas escritas sequenciais) em vez de um par de arquivos por hino
+SINGLE_FILE_OUTPUT: Final[bool] = False
+OUTPUT_JSONL_FILE = "./output/ccb.jsonl"
+OUTPUT_MD_FILE = "./output/ccb.md"
+# Partes fixas do front matter do Markdown
+MD_FRONT_OPEN = "---\nno: "
+MD_FRONT_MID = "\ntitle: "
+MD_FRONT_CLOSE = "\n---\n\n"
+
+# Cabeçalho "Hino X – Título"; o corpo vai até o próximo cabeçalho
+# (padrão em bytes, aplicado direto sobre o arquivo mapeado em memória)
+HYMN_HEADER_RE = re.compile(
+    r"\f?Hino[^\S\n]+(\d+)[^\S\n]+(?:–|-)[^\S\n]+([^\n]+)\n?".encode("utf-8")
+)
+
+# Padrões usados em parse_hymn_block
+TITLE_PARENS_RE = re.compile(r"\s*\(.*?\)\s*")
 
 console = Console()
 
 
-def parse_hymn_block(block: str) -> Optional[Dict]:
-    """Processa um bloco de texto cru contendo um único hino."""
-    raw_lines = block.splitlines()
-
-    # Encontra a linha do cabeçalho
-    header_line_idx = -1
-    header_pattern = r"Hino\s+(\d+)\s+[–-]\s+(.+)"
+def split_verse(line: str) -> Optional[Tuple[int, str]]:
+    """Separa o número inicial de um verso ("1. Texto" ou "1 Texto").
 
-    for i, line in enumerate(raw_lines):
-        match = re.search(header_pattern, line.strip(), re.IGNORECASE)
-        if match:
-            header_line_idx = i
-            hino_id = int(match.group(1))
-            title = match.group(2).strip()
-            break
-
-    if header_line_idx == -1:
+    Varredura manual equivalente a ``^(\\d+)\\s*\\.?(.*)``: a maioria das
+    linhas começa com letra e é descartada já no primeiro caractere.
+    """
+    if not line or not line[0].isdecimal():
         return None
 
-    # Verificar se o título continua na próxima linha
-    # Só é continuação se: próxima linha existe, não está vazia, e não é verso/coro
-    body_start_idx = header_line_idx + 1
-
-    if body_start_idx < len(raw_lines):
-        next_line = raw_lines[body_start_idx].strip()
+    size = len(line)
+    i = 1
+    while i < size and line[i].isdecimal():
+        i += 1
+    j = i
+    while j < size and line[j].isspace():
+        j += 1
+    if j < size and line[j] == ".":
+        j += 1
+    return int(line[:i]), line[j:].strip()
+
+
+def split_chorus(line: str) -> Optional[str]:
+    """Devolve o texto após o marcador "CORO"/"Coro" (":" opcional), ou None
+    se a linha não é coro. O texto só usa essas duas grafias, então um teste
+    literal substitui a regex com IGNORECASE."""
+    if line[:4] not in ("CORO", "Coro"):
+        return None
 
-        # Verifica se há uma linha de continuação do título
-        # Critérios: linha não vazia, não começa com número, não é CORO,
-        # e a linha seguinte está vazia (indicando que é só o título)
-        if (
-            next_line
-            and not re.match(r"^\d+\s*\.?", next_line)
-            and not re.match(r"^(?:CORO|Coro)", next_line, re.IGNORECASE)
-        ):
-            # Verifica se após essa linha há linha vazia (confirma que é título)
-            if (
-                body_start_idx + 1 < len(raw_lines)
-                and not raw_lines[body_start_idx + 1].strip()
-            ):
-                title += " " + next_line
-                body_start_idx += 1
-
-    # 2. Processar Letra (trabalha com linhas originais, não stripped)
-    raw_body_lines = raw_lines[body_start_idx:]  # Começa do corpo do hino
-
-    lyrics_parts = []
+    rest = line[4:].lstrip()
+    if rest[:1] == ":":
+        rest = rest[1:]
+    return rest.strip()
+
+
+def parse_hymn_block(hino_id: int, title: str, body: bytes) -> Dict:
+    """Processa o corpo cru de um único hino, já separado do cabeçalho."""
+    # Percorre as linhas por um iterador (sem fatiar a lista nem acesso por
+    # índice); só as duas primeiras são espiadas para decidir a continuação
+    # do título
+    lines = iter(body.decode("utf-8").splitlines())
+    first_line = next(lines, "")
+    second_line = next(lines, None)
+    head = [first_line] if second_line is None else [first_line, second_line]
+
+    # Verificar se o título continua na primeira linha do corpo
+    next_line = first_line.strip()
+
+    # Verifica se há uma linha de continuação do título
+    # Critérios: linha não vazia, não começa com número, não é CORO,
+    # e a linha seguinte existe e está vazia (confirma que é só o título)
+    if (
+        next_line
+        and not next_line[0].isdecimal()
+        and next_line[:4].lower() != "coro"
+        and second_line is not None
+        and not second_line.strip()
+    ):
+        title += " " + next_line
+        del head[0]
+
+    # 2. Processar Letra
+    # Letra montada como lista plana de pedaços, unidos uma única vez no fim
+    lyrics_tokens = []
     current_label = ""
     current_buffer = []
     next_verse_number = 1
     expecting_new_block = False
 
+    # Métodos quentes do laço ligados a variáveis locais (evita a busca de
+    # atributo a cada linha)
+    append = current_buffer.append
+
     def flush_buffer():
         if current_label and current_buffer:
-            text = "\n".join(current_buffer)
-            lyrics_parts.append(f"[{current_label}]\n{text}")
+            lyrics_tokens.extend(
+                ("[", current_label, "]\n", "\n".join(current_buffer), "\n\n")
+            )
         current_buffer.clear()
 
-    for line in raw_body_lines:
+    for line in chain(head, lines):
         stripped = line.strip()
 
         # Ignora linhas completamente vazias
@@ -80,30 +132,23 @@ def parse_hymn_block(block: str) -> Optional[Dict]:
                 expecting_new_block = True
             continue
 
-        # Detecta Verso (ex: "1. Texto" ou "1 Texto")
-        verse_match = re.match(r"^(\d+)\s*\.?(.*)", stripped)
-
-        # Detecta Coro
-        chorus_match = re.match(
-            r"^(?:CORO|Coro)(?:\s*:)?\s*(.*)", stripped, re.IGNORECASE
-        )
-
-        if verse_match:
+        # Despacha pelo primeiro caractere: dígito → Verso (ex: "1. Texto"
+        # ou "1 Texto"), "C" → talvez Coro; o resto é texto
+        first_char = stripped[0]
+        if first_char.isdecimal():
             flush_buffer()
-            verse_num = int(verse_match.group(1))
+            verse_num, content = split_verse(stripped)
             next_verse_number = verse_num + 1
             current_label = f"Verse {verse_num}"
-            content = verse_match.group(2).strip()
             if content:
-                current_buffer.append(content)
+                append(content)
             expecting_new_block = False
 
-        elif chorus_match:
+        elif first_char == "C" and (content := split_chorus(stripped)) is not None:
             flush_buffer()
             current_label = "Chorus"
-            content = chorus_match.group(1).strip()
             if content:
-                current_buffer.append(content)
+                append(content)
             expecting_new_block = False
 
         else:
@@ -113,73 +158,136 @@ def parse_hymn_block(block: str) -> Optional[Dict]:
                 flush_buffer()
                 current_label = f"Verse {next_verse_number}"
                 next_verse_number += 1
-                current_buffer.append(stripped)
+                append(stripped)
                 expecting_new_block = False
             elif current_label:
                 # Continuação do bloco atual
-                current_buffer.append(stripped)
+                append(stripped)
             else:
                 # Primeiro bloco sem numeração
                 current_label = "Verse 1"
                 next_verse_number = 2
-                current_buffer.append(stripped)
+                append(stripped)
                 expecting_new_block = False
 
     flush_buffer()  # Salva o último bloco
 
-    title = re.sub(r"\s*\(.*?\)\s*", "", title).strip()
+    title = TITLE_PARENS_RE.sub("", title).strip()
     title = title.rstrip(" –")
-    return {"no": hino_id, "title": title, "lyrics": "\n\n".join(lyrics_parts)}
-
-
-def main():
-    if not os.path.exists(OUTPUT_JSON_DIR):
-        os.makedirs(OUTPUT_JSON_DIR)
+    return {
+        "no": hino_id,
+        "title": title,
+        "lyrics": "".join(lyrics_tokens).rstrip("\n"),
+    }
+
+
+def dumps_json(data: Dict, pretty: bool) -> bytes:
+    """Serializa em UTF-8 com orjson ou, se ele não estiver instalado, com o
+    json da stdlib na mesma formatação."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def md_pieces(hymn_data: Dict) -> Tuple[str, ...]:
+    """Pedaços do Markdown de um hino (front matter + letra), na ordem."""
+    return (
+        MD_FRONT_OPEN,
+        str(hymn_data["no"]),
+        MD_FRONT_MID,
+        hymn_data["title"],
+        MD_FRONT_CLOSE,
+        hymn_data["lyrics"],
+        "\n",
+    )
 
-    if not os.path.exists(OUTPUT_MD_DIR):
-        os.makedirs(OUTPUT_MD_DIR)
 
-    if not os.path.exists(INPUT_FILE):
-        console.print(f"[bold red]Arquivo {INPUT_FILE} não encontrado.[/bold red]")
-        return
+def format_md(hymn_data: Dict) -> str:
+    """Monta o Markdown de um hino, com front matter."""
+    return "".join(md_pieces(hymn_data))
 
-    console.print(f"[bold blue]Lendo arquivo:[/bold blue] {INPUT_FILE}")
 
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        content = f.read()
+def emit(hymn_data: Dict) -> None:
+    """Salva o JSON (mantém \\n escapado) e o Markdown (com quebras de linha
+    reais) de um hino."""
+    no = hymn_data["no"]
+    with open(f"{JSON_PREFIX}{no}.json", "wb") as f:
+        f.write(dumps_json(hymn_data, PRETTY_JSON))
+    with open(f"{MD_PREFIX}{no}.md", "w", encoding="utf-8", buffering=1 << 15) as f:
+        f.writelines(md_pieces(hymn_data))
 
-    # Divide o arquivo inteiro baseando-se no marcador de página/título
-    # Regex busca o padrão "Hino X" precedido por form feed (\x0c) ou início de linha
-    raw_hymns = re.split(r"(?=\f?Hino\s+\d+\s+[–-])", content)
 
-    # Filtra strings vazias resultantes do split
-    raw_hymns = [h for h in raw_hymns if h.strip()]
+def write_single_files(hymns: List[Dict]) -> None:
+    """Exporta todos os hinos em um único JSONL e um único Markdown."""
+    with open(OUTPUT_JSONL_FILE, "wb", buffering=1 << 20) as f:
+        for hymn_data in hymns:
+            f.write(dumps_json(hymn_data, pretty=False))
+            f.write(b"\n")
 
-    for raw_block in track(raw_hymns, description="Processando hinos..."):
-        hymn_data = parse_hymn_block(raw_block)
+    with open(OUTPUT_MD_FILE, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write("\n".join(format_md(hymn_data) for hymn_data in hymns))
 
-        if hymn_data:
-            # Salva JSON (mantém \n escapado)
-            json_file_name = f"{hymn_data['no']}.json"
-            json_file_path = os.path.join(OUTPUT_JSON_DIR, json_file_name)
 
-            with open(json_file_path, "w", encoding="utf-8") as f:
-                json.dump(hymn_data, f, indent=2, ensure_ascii=False)
+def main():
+    if SINGLE_FILE_OUTPUT:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+    else:
+        os.makedirs(OUTPUT_JSON_DIR, exist_ok=True)
+        os.makedirs(OUTPUT_MD_DIR, exist_ok=True)
 
-            # Salva Markdown (com quebras de linha reais)
-            md_file_name = f"{hymn_data['no']}.md"
-            md_file_path = os.path.join(OUTPUT_MD_DIR, md_file_name)
+    if not os.path.exists(INPUT_FILE):
+        console.print(f"[bold red]Arquivo {INPUT_FILE} não encontrado.[/bold red]")
+        return
 
-            md_content = f"""---
-no: {hymn_data['no']}
-title: {hymn_data['title']}
----
+    console.print(f"[bold blue]Lendo arquivo:[/bold blue] {INPUT_FILE}")
 
-{hymn_data['lyrics']}
-"""
+    # Localiza os cabeçalhos em uma única passada e recorta o corpo de cada
+    # hino até o cabeçalho seguinte (que pode vir precedido por form feed \x0c).
+    # O corpo só é decodificado dentro de parse_hymn_block
+    # mmap não aceita arquivo vazio (ValueError); vazio significa 0 hinos
+    raw_hymns = []
+    if os.path.getsize(INPUT_FILE):
+        with (
+            open(INPUT_FILE, "rb") as f,
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content,
+        ):
+            headers = list(HYMN_HEADER_RE.finditer(content))
+            body_ends = [m.start() for m in headers[1:]] + [len(content)]
+            raw_hymns = [
+                (
+                    int(m.group(1)),
+                    m.group(2).decode("utf-8").strip(),
+                    content[m.end() : end],
+                )
+                for m, end in zip(headers, body_ends)
+            ]
+
+    # Parse e escrita em série, na ordem do arquivo (número repetido: vale o
+    # último). O parse de todo o hinário leva poucos ms, menos do que criar
+    # processos e serializar os corpos custaria
+    hymns = []
+    results = starmap(parse_hymn_block, raw_hymns)
+    # Barra de progresso só em terminal interativo; redirecionado para
+    # arquivo/pipe, o Rich não desenha nada útil e só custa tempo
+    if console.is_terminal:
+        results = track(
+            results,
+            total=len(raw_hymns),
+            description="Processando hinos...",
+            console=console,
+        )
+    for hymn_data in results:
+        if not hymn_data:
+            continue
+        if SINGLE_FILE_OUTPUT:
+            hymns.append(hymn_data)
+        else:
+            emit(hymn_data)
 
-            with open(md_file_path, "w", encoding="utf-8") as f:
-                f.write(md_content)
+    if SINGLE_FILE_OUTPUT:
+        write_single_files(hymns)
 
     console.print(
         f"[bold green]Sucesso! {len(raw_hymns)} hinos exportados para JSON e Markdown[/bold green]"